@@ -0,0 +1,151 @@
+import asyncio
+import json
+import math
+import time
+from collections import deque
+from typing import Dict, List, Tuple
+
+
+class AdmissionClass:
+    """
+    A bounded pool of request slots. Up to `concurrency` requests run at once,
+    up to `queue_size` more wait for a slot for at most `queue_timeout` seconds,
+    and anything beyond that is shed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        concurrency: int,
+        queue_size: int,
+        queue_timeout: float,
+        retry_after: int,
+    ):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = None
+        self._loop = None
+        self.waiting = 0
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.queue_times = deque(maxlen=1024)
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created inside the running loop rather than at import time, and
+        # replaced if the app is later served from a different loop.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    def metrics(self) -> Dict:
+        samples = sorted(self.queue_times)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "queue_time_p50": percentile(0.50),
+            "queue_time_p99": percentile(0.99),
+            "queue_time_max": samples[-1] if samples else 0.0,
+        }
+
+
+class AdmissionControlMiddleware:
+    """
+    Classifies each HTTP request by path prefix and runs it inside the slot
+    pool of its class, so a burst of expensive LLM-backed requests queues
+    behind its own limit instead of starving cheap reads. Requests that cannot
+    be queued get a 429, requests that wait too long get a 503, both with a
+    `Retry-After` header.
+    """
+
+    def __init__(
+        self,
+        app,
+        classes: List[AdmissionClass],
+        routes: List[Tuple[str, str]],
+        default: str,
+    ):
+        self.app = app
+        self.classes = {admission.name: admission for admission in classes}
+        self.routes = routes
+        self.default = default
+
+    def classify(self, path: str) -> AdmissionClass:
+        for prefix, name in self.routes:
+            if path.startswith(prefix):
+                return self.classes[name]
+        return self.classes[self.default]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        admission = self.classify(scope["path"])
+        # Check and claim a place without awaiting in between, so requests
+        # arriving in the same event-loop tick cannot all see a free queue.
+        if admission.running + admission.waiting >= (
+            admission.concurrency + admission.queue_size
+        ):
+            admission.rejected += 1
+            await self.reject(send, 429, admission, "Too many queued requests")
+            return
+
+        queued_at = time.perf_counter()
+        admission.waiting += 1
+        semaphore = admission.semaphore
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=admission.queue_timeout)
+        except asyncio.TimeoutError:
+            admission.timed_out += 1
+            await self.reject(send, 503, admission, "Server is busy")
+            return
+        finally:
+            admission.waiting -= 1
+
+        admission.queue_times.append(time.perf_counter() - queued_at)
+        admission.admitted += 1
+        admission.running += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.running -= 1
+            semaphore.release()
+
+    async def reject(self, send, status: int, admission: AdmissionClass, detail: str):
+        # Scale the hint with how far behind this class currently is.
+        backlog = admission.waiting / max(admission.concurrency, 1)
+        retry_after = max(
+            admission.retry_after, math.ceil(admission.retry_after * backlog)
+        )
+        body = json.dumps({"detail": detail}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(retry_after).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
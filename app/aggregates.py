@@ -0,0 +1,243 @@
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, event, func, inspect, literal, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, select
+
+from app.models import EntityFacetCount, EntitySummary, EntitySummaryRead, Insight
+
+FACETS = ("category", "impact")
+TRACKED_FIELDS = ("entity", "confidence", "created_at") + FACETS
+
+
+class _EntityDelta:
+    def __init__(self):
+        self.count = 0
+        self.confidence = 0.0
+        self.latest = None
+        self.removed = False
+        self.facets = defaultdict(int)
+
+    def add(self, values: Dict, sign: int):
+        self.count += sign
+        self.confidence += sign * values["confidence"]
+        for facet in FACETS:
+            self.facets[(facet, values[facet])] += sign
+        if sign > 0:
+            if self.latest is None or values["created_at"] > self.latest:
+                self.latest = values["created_at"]
+        else:
+            self.removed = True
+
+
+def _current_values(insight: Insight) -> Dict:
+    return {field: getattr(insight, field) for field in TRACKED_FIELDS}
+
+
+def _previous_values(insight: Insight) -> Dict:
+    state = inspect(insight)
+    values = {}
+    for field in TRACKED_FIELDS:
+        history = state.attrs[field].history
+        if history.deleted:
+            values[field] = history.deleted[0]
+        else:
+            values[field] = getattr(insight, field)
+    return values
+
+
+def _collect_deltas(session: Session) -> Dict[str, _EntityDelta]:
+    deltas = defaultdict(_EntityDelta)
+    for obj in session.new:
+        if isinstance(obj, Insight):
+            values = _current_values(obj)
+            deltas[values["entity"]].add(values, 1)
+    for obj in session.deleted:
+        if isinstance(obj, Insight):
+            values = _previous_values(obj)
+            deltas[values["entity"]].add(values, -1)
+    for obj in session.dirty:
+        if isinstance(obj, Insight) and session.is_modified(obj):
+            before, after = _previous_values(obj), _current_values(obj)
+            if before != after:
+                deltas[before["entity"]].add(before, -1)
+                deltas[after["entity"]].add(after, 1)
+    return deltas
+
+
+def _apply_deltas(connection, deltas: Dict[str, _EntityDelta]):
+    summary = EntitySummary.__table__
+    facets = EntityFacetCount.__table__
+
+    for entity, delta in deltas.items():
+        stmt = insert(summary).values(
+            entity=entity,
+            insight_count=delta.count,
+            confidence_sum=delta.confidence,
+            latest_created_at=delta.latest,
+        )
+        connection.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[summary.c.entity],
+                set_={
+                    "insight_count": summary.c.insight_count
+                    + stmt.excluded.insight_count,
+                    "confidence_sum": summary.c.confidence_sum
+                    + stmt.excluded.confidence_sum,
+                    # GREATEST ignores NULLs, so a pure delete keeps the old value.
+                    "latest_created_at": func.greatest(
+                        summary.c.latest_created_at, stmt.excluded.latest_created_at
+                    ),
+                },
+            )
+        )
+
+        for (facet, value), count in delta.facets.items():
+            if count == 0:
+                continue
+            stmt = insert(facets).values(
+                entity=entity, facet=facet, value=value, count=count
+            )
+            connection.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[facets.c.entity, facets.c.facet, facets.c.value],
+                    set_={"count": facets.c.count + stmt.excluded.count},
+                )
+            )
+
+        if delta.removed:
+            # The newest insight may have been the one removed. The max is read
+            # from the end of this entity's range in the (entity, created_at)
+            # index created at startup, without visiting its insight rows.
+            latest = (
+                select(func.max(Insight.created_at))
+                .where(Insight.entity == entity)
+                .scalar_subquery()
+            )
+            connection.execute(
+                update(summary)
+                .where(summary.c.entity == entity)
+                .values(latest_created_at=latest)
+            )
+            connection.execute(
+                delete(facets).where(facets.c.entity == entity, facets.c.count <= 0)
+            )
+            connection.execute(
+                delete(summary).where(
+                    summary.c.entity == entity, summary.c.insight_count <= 0
+                )
+            )
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+# An expired instance (the default after commit) has no old value to record
+# when one of these attributes is set. active_history makes SQLAlchemy load
+# it first, so edits still reach the rollups.
+for _field in TRACKED_FIELDS:
+    event.listen(
+        getattr(Insight, _field), "set", _load_previous_value, active_history=True
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def collect_entity_deltas(session, flush_context, instances):
+    """
+    Reads the insight changes while every row is still in the database, so
+    expired instances that are about to be deleted can still be loaded.
+    """
+    session.info["entity_deltas"] = _collect_deltas(session)
+
+
+@event.listens_for(Session, "after_flush")
+def update_entity_summaries(session, flush_context):
+    """
+    Keeps the entity rollups in the same transaction as the insight writes that
+    change them. Runs for every code path that adds, edits or deletes an Insight.
+    """
+    deltas = session.info.pop("entity_deltas", None)
+    if deltas:
+        _apply_deltas(session.connection(), deltas)
+
+
+def rebuild_entity_summaries(session: Session):
+    """
+    Recomputes every rollup from the insight table. Only needed to backfill
+    data written before the summary tables existed.
+    """
+    connection = session.connection()
+    connection.execute(delete(EntityFacetCount.__table__))
+    connection.execute(delete(EntitySummary.__table__))
+    connection.execute(
+        insert(EntitySummary.__table__).from_select(
+            ["entity", "insight_count", "confidence_sum", "latest_created_at"],
+            select(
+                Insight.entity,
+                func.count(),
+                func.sum(Insight.confidence),
+                func.max(Insight.created_at),
+            ).group_by(Insight.entity),
+        )
+    )
+    for facet in FACETS:
+        column = getattr(Insight, facet)
+        connection.execute(
+            insert(EntityFacetCount.__table__).from_select(
+                ["entity", "facet", "value", "count"],
+                select(Insight.entity, literal(facet), column, func.count()).group_by(
+                    Insight.entity, column
+                ),
+            )
+        )
+    session.commit()
+
+
+def read_entity_summaries(
+    session: Session, entities: Optional[List[str]] = None, limit: int = 100
+) -> List[EntitySummaryRead]:
+    """
+    Reads rollups for the given entities, or the `limit` entities with the most
+    insights when none are given. Cost depends on the number of entities
+    returned, never on the number of insights behind them.
+    """
+    statement = select(EntitySummary)
+    if entities:
+        statement = statement.where(EntitySummary.entity.in_(entities))
+    else:
+        statement = statement.order_by(EntitySummary.insight_count.desc()).limit(
+            limit
+        )
+    summaries = session.exec(statement).all()
+    if not summaries:
+        return []
+    facet_rows = session.exec(
+        select(EntityFacetCount).where(
+            EntityFacetCount.entity.in_([summary.entity for summary in summaries])
+        )
+    ).all()
+
+    breakdowns = defaultdict(lambda: {facet: {} for facet in FACETS})
+    for row in facet_rows:
+        breakdowns[row.entity][row.facet][row.value] = row.count
+
+    results = []
+    for summary in summaries:
+        breakdown = breakdowns[summary.entity]
+        results.append(
+            EntitySummaryRead(
+                entity=summary.entity,
+                insight_count=summary.insight_count,
+                mean_confidence=(
+                    summary.confidence_sum / summary.insight_count
+                    if summary.insight_count
+                    else None
+                ),
+                latest_created_at=summary.latest_created_at,
+                by_category=breakdown["category"],
+                by_impact=breakdown["impact"],
+            )
+        )
+    return results
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 8
+
+# Shared by every synchronous stage, so no caller can start more than
+# MAX_WORKERS threads however many items it maps over.
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="deadline")
+
+
+class Deadline:
+    """
+    A time budget for one request, passed through every stage of the research
+    path. Stages that cannot start before the budget runs out are skipped, and
+    stages still running when it does are abandoned. Either way the request is
+    marked `partial` and callers return whatever finished. `timings` records
+    how long each stage took, in seconds.
+    """
+
+    def __init__(self, budget: Optional[float] = None):
+        self.started = time.perf_counter()
+        self.expires_at = None if budget is None else self.started + budget
+        self.partial = False
+        self.timings: Dict[str, float] = {}
+        self.abandoned: List[asyncio.Future] = []
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left in the budget, or None when there is no budget."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.perf_counter())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() == 0.0
+
+    def skip(self, stage: str):
+        self.partial = True
+        self.timings.setdefault(stage, 0.0)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (
+                time.perf_counter() - start
+            )
+
+    def call(self, stage: str, fn: Callable, *args, default=None, **kwargs):
+        """
+        Runs `fn` unless the budget is already spent, and stops waiting for it
+        when the budget runs out. A call cut off this way returns `default`
+        and keeps running in the background; exceptions from `fn` propagate.
+        """
+        if self.expired:
+            self.skip(stage)
+            return default
+        with self.stage(stage):
+            if self.expires_at is None or _on_executor():
+                # Nothing to cap, or already inside a capped stage; submitting
+                # from a worker could deadlock a saturated pool.
+                return fn(*args, **kwargs)
+            future = _executor.submit(fn, *args, **kwargs)
+            done, _ = wait([future], timeout=self.remaining())
+            if not done:
+                future.cancel()
+                self.partial = True
+                return default
+            return future.result()
+
+    def map(self, stage: str, fn: Callable, items: Iterable) -> List:
+        """
+        Runs `fn` over `items` on the shared executor and returns the results
+        that completed within the budget, in input order. Items not started by
+        the deadline are cancelled and those still running are abandoned.
+        Items that fail are logged and dropped. Any missing item marks the
+        result `partial`.
+        """
+        items = list(items)
+        if not items:
+            return []
+        if self.expired:
+            self.skip(stage)
+            return []
+        with self.stage(stage):
+            futures = [_executor.submit(fn, item) for item in items]
+            done, pending = wait(futures, timeout=self.remaining())
+            for future in pending:
+                future.cancel()
+        if pending:
+            self.partial = True
+        results = []
+        for item, future in zip(items, futures):
+            if future not in done:
+                continue
+            if future.exception() is not None:
+                logger.warning(
+                    "Stage %s failed for %r: %s", stage, item, future.exception()
+                )
+                self.partial = True
+                continue
+            results.append(future.result())
+        return results
+
+    async def run(
+        self,
+        stage: str,
+        executor: Executor,
+        fn: Callable,
+        *args,
+        default=None,
+    ):
+        """
+        Runs a blocking `fn` on `executor` and stops waiting for it when the
+        budget runs out. A thread cannot be cancelled, so a call that is still
+        running is kept in `abandoned`; await `drain` before releasing whatever
+        limits how many of these calls may run at once.
+        """
+        if self.expired:
+            self.skip(stage)
+            return default
+        with self.stage(stage):
+            future = asyncio.wrap_future(executor.submit(fn, *args))
+            try:
+                return await asyncio.wait_for(
+                    asyncio.shield(future), timeout=self.remaining()
+                )
+            except asyncio.TimeoutError:
+                self.partial = True
+                self.abandoned.append(future)
+                return default
+
+    async def drain(self):
+        """Waits for abandoned calls to finish, discarding their results."""
+        if self.abandoned:
+            await asyncio.gather(*self.abandoned, return_exceptions=True)
+
+
+def _on_executor() -> bool:
+    return threading.current_thread().name.startswith("deadline")
@@ -0,0 +1,325 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+# Only the standard library is imported at module level, so the CLI at the
+# bottom runs on hosts without the server's dependencies.
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 500
+
+
+class ExportCursor:
+    """
+    Iterates matching rows in ULID order through a server-side cursor, so
+    memory stays at roughly `batch_size` rows however large the table is. Rows
+    are plain mappings rather than ORM objects, which keeps them out of any
+    identity map.
+
+    The cursor holds a pooled connection until it is exhausted or `close` is
+    called. `close` is safe to call from another thread while a fetch is in
+    flight; it waits for that fetch to finish first.
+    """
+
+    def __init__(self, engine, table, filters: List, batch_size: int = BATCH_SIZE):
+        from sqlalchemy import select
+
+        statement = select(table).where(*filters).order_by(table.c.id)
+        self.lock = threading.Lock()
+        self.closed = False
+        self.connection = engine.connect()
+        try:
+            self.result = self.connection.execution_options(
+                stream_results=True, max_row_buffer=batch_size
+            ).execute(statement)
+        except Exception:
+            self.connection.close()
+            raise
+        self.rows = self.result.mappings()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.lock:
+            if self.closed:
+                raise StopIteration
+            try:
+                return next(self.rows)
+            except StopIteration:
+                self._close()
+                raise
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def _close(self):
+        if not self.closed:
+            self.closed = True
+            self.result.close()
+            self.connection.close()
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_ndjson(rows) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps({key: _serialize(value) for key, value in row.items()}) + "\n"
+
+
+def encode_csv(rows, columns: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_serialize(row[column]) for column in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def chunked(lines: Iterator[str], size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    buffer = []
+    length = 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b"".join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def gzipped(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether an Accept-Encoding header allows gzip, honouring q-values."""
+    qualities = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def stream_export(
+    engine, table, filters: List, format: str, accept_encoding: Optional[str]
+):
+    from fastapi.responses import StreamingResponse
+    from starlette.background import BackgroundTask
+
+    rows = ExportCursor(engine, table, filters)
+    if format == "csv":
+        lines = encode_csv(rows, [column.name for column in table.columns])
+        media_type = "text/csv"
+    else:
+        lines = encode_ndjson(rows)
+        media_type = "application/x-ndjson"
+
+    body = chunked(lines)
+    headers = {"Vary": "Accept-Encoding"}
+    if accepts_gzip(accept_encoding):
+        body = gzipped(body)
+        headers["Content-Encoding"] = "gzip"
+    # The background task also runs when the client disconnects mid-stream,
+    # returning the connection to the pool instead of leaving it to the GC.
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers=headers,
+        background=BackgroundTask(rows.close),
+    )
+
+
+def _rfind_newline(f, end: int) -> int:
+    """Offset of the last newline before `end`, reading backwards in chunks."""
+    while end > 0:
+        start = max(0, end - CHUNK_SIZE)
+        f.seek(start)
+        index = f.read(end - start).rfind(b"\n")
+        if index != -1:
+            return start + index
+        end = start
+    return -1
+
+
+def prepare_resume(path: str) -> Optional[str]:
+    """
+    Drops a trailing partial line left by an interrupted NDJSON export and
+    returns the ULID of the last complete record, or None when the file holds
+    no complete record. Raises ValueError when the last line is not a record.
+    """
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        return None
+    with f:
+        last = _rfind_newline(f, f.seek(0, io.SEEK_END))
+        f.truncate(last + 1)
+        if last == -1:
+            return None
+        previous = _rfind_newline(f, last)
+        f.seek(previous + 1)
+        line = f.read(last - previous - 1)
+    try:
+        return json.loads(line)["id"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError(f"{path}: last line is not an exported record")
+
+
+class ExportError(Exception):
+    pass
+
+
+def retry_after_seconds(value: Optional[str], fallback: int = 30) -> int:
+    """Seconds to wait from a Retry-After header given in seconds."""
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return fallback
+
+
+def open_export(request, retries: int, sleep=time.sleep):
+    """
+    Opens the export stream. A 429 or 503 from the server's admission control
+    is retried up to `retries` times after waiting for its Retry-After. Any
+    other failure raises ExportError.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return urllib.request.urlopen(request)
+        except urllib.error.HTTPError as e:
+            if e.code not in (429, 503) or attempt == retries:
+                raise ExportError(f"server returned {e.code} {e.reason}") from e
+            wait = retry_after_seconds(e.headers.get("Retry-After"))
+            print(
+                f"server busy ({e.code}), retrying in {wait}s "
+                f"({attempt + 1}/{retries})",
+                file=sys.stderr,
+            )
+            sleep(wait)
+        except urllib.error.URLError as e:
+            raise ExportError(f"could not reach server: {e.reason}") from e
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stream a bulk export of insights or queries to a file."
+    )
+    parser.add_argument("resource", choices=["insights", "queries"])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--entity")
+    parser.add_argument("--category")
+    parser.add_argument("--created-after")
+    parser.add_argument("--created-before")
+    parser.add_argument("--after", help="Only export records with a greater ULID.")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Append to an existing NDJSON output, continuing after its last id.",
+    )
+    parser.add_argument(
+        "--output", "-o", help="Output file; a .gz suffix keeps it compressed."
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="Times to retry after a 429 or 503, waiting for Retry-After.",
+    )
+    args = parser.parse_args()
+
+    mode = "wb"
+    if args.resume:
+        if args.format != "ndjson" or not args.output or args.output.endswith(".gz"):
+            parser.error("--resume needs an uncompressed NDJSON --output file")
+        try:
+            args.after = prepare_resume(args.output) or args.after
+        except ValueError as e:
+            parser.error(str(e))
+        mode = "ab"
+
+    params = {
+        "format": args.format,
+        "entity": args.entity,
+        "category": args.category,
+        "created_after": args.created_after,
+        "created_before": args.created_before,
+        "after": args.after,
+    }
+    if args.resource == "queries":
+        del params["entity"], params["category"]
+    query = urllib.parse.urlencode({k: v for k, v in params.items() if v})
+    request = urllib.request.Request(
+        f"{args.url}/export/{args.resource}?{query}",
+        headers={"Accept-Encoding": "gzip"},
+    )
+
+    try:
+        response = open_export(request, args.retries)
+    except ExportError as e:
+        print(f"export failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    keep_compressed = bool(args.output and args.output.endswith(".gz"))
+    output = open(args.output, mode) if args.output else sys.stdout.buffer
+    try:
+        with response:
+            compressed = response.headers.get("Content-Encoding") == "gzip"
+            decompressor = None
+            if compressed and not keep_compressed:
+                decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                output.write(decompressor.decompress(chunk) if decompressor else chunk)
+            if decompressor:
+                output.write(decompressor.flush())
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,28 @@
+import asyncio
 import ulid
 import marvin
-from typing import List, Dict
-from fastapi import Depends, FastAPI, HTTPException
+from typing import Dict, List, Literal, Optional
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import BackgroundTasks, Depends, FastAPI, Header, HTTPException
+from fastapi import Query as QueryParam
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import text
 from sqlmodel import Session, SQLModel, create_engine
 from datetime import datetime
 from app import settings
-from app.models import Insight, InsightCreate, Query, QueryFetch, QueryFetchAnswer
+from app.models import (
+    EntitySummary,
+    EntitySummaryRead,
+    Insight,
+    InsightCreate,
+    Query,
+    QueryFetch,
+    QueryFetchAnswer,
+)
+from app.admission import AdmissionClass, AdmissionControlMiddleware
+from app.aggregates import read_entity_summaries, rebuild_entity_summaries
+from app.deadline import Deadline
+from app.export import stream_export
 
 connection_string = str(settings.DATABASE_URL).replace(
     "postgresql", "postgresql+psycopg"
@@ -17,6 +33,20 @@ engine = create_engine(connection_string, pool_pre_ping=True)
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        # create_all skips tables that already exist, so add the index behind
+        # the entity rollups explicitly.
+        session.connection().execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS ix_insight_entity_created_at "
+                "ON insight (entity, created_at)"
+            )
+        )
+        session.commit()
+        # Backfill rollups once for insights written before they existed.
+        if session.query(EntitySummary).first() is None:
+            if session.query(Insight).first() is not None:
+                rebuild_entity_summaries(session)
 
 
 def get_session():
@@ -24,8 +54,58 @@ def get_session():
         yield session
 
 
+def get_deadline(
+    deadline_ms: Optional[int] = QueryParam(default=None, gt=0),
+    x_request_deadline: Optional[int] = Header(default=None, gt=0),
+) -> Deadline:
+    """
+    Time budget for the request in milliseconds, from the `deadline_ms` query
+    parameter or the `X-Request-Deadline` header. Unbounded when neither is set.
+    """
+    budget = deadline_ms or x_request_deadline
+    return Deadline(None if budget is None else budget / 1000)
+
+
 app = FastAPI()
 
+admission_classes = [
+    AdmissionClass(
+        "expensive",
+        concurrency=settings.EXPENSIVE_CONCURRENCY,
+        queue_size=settings.EXPENSIVE_QUEUE_SIZE,
+        queue_timeout=settings.EXPENSIVE_QUEUE_TIMEOUT,
+        retry_after=10,
+    ),
+    AdmissionClass(
+        "export",
+        concurrency=settings.EXPORT_CONCURRENCY,
+        queue_size=settings.EXPORT_QUEUE_SIZE,
+        queue_timeout=settings.EXPORT_QUEUE_TIMEOUT,
+        retry_after=30,
+    ),
+    AdmissionClass(
+        "cheap",
+        concurrency=settings.CHEAP_CONCURRENCY,
+        queue_size=settings.CHEAP_QUEUE_SIZE,
+        queue_timeout=settings.CHEAP_QUEUE_TIMEOUT,
+        retry_after=1,
+    ),
+]
+
+# Threads for the blocking marvin calls, two per expensive request. Requests
+# hold their admission slot until their calls finish, so this never queues.
+llm_executor = ThreadPoolExecutor(
+    max_workers=2 * settings.EXPENSIVE_CONCURRENCY, thread_name_prefix="llm"
+)
+
+# Added before CORS so that shed requests still carry CORS headers.
+app.add_middleware(
+    AdmissionControlMiddleware,
+    classes=admission_classes,
+    routes=[("/query/fetch-answer", "expensive"), ("/export/", "export")],
+    default="cheap",
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -50,6 +130,11 @@ def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics/admission")
+def admission_metrics():
+    return {admission.name: admission.metrics() for admission in admission_classes}
+
+
 from fastapi import HTTPException
 from sqlalchemy.exc import IntegrityError
 
@@ -101,8 +186,10 @@ async def handle_query(query: str, session: Session = Depends(get_session)):
     db_query = Query(
         id=query_id,
         content=query,
+        # Each copy needs its own id; the dummies' ids are fixed at import.
         insights=[
-            Insight(**insight.dict(), query_id=query_id) for insight in dummy_insights
+            Insight(**insight.dict(exclude={"id"}), query_id=query_id)
+            for insight in dummy_insights
         ],
         created_at=datetime.now(),
         updated_at=datetime.now(),
@@ -145,17 +232,45 @@ async def fetch_query(query_id: str, session: Session = Depends(get_session)):
 
 
 @app.get("/query/fetch-answer/{query_id}", response_model=QueryFetchAnswer)
-async def fetch_query(query_id: str, session: Session = Depends(get_session)):
-    query = session.query(Query).filter(Query.id == query_id).first()
-    if query is None:
-        raise HTTPException(status_code=404, detail="Query not found")
-    question = query.content
-    insights = session.query(Insight).filter(Insight.query_id == query_id).all()
+async def fetch_query(
+    query_id: str,
+    background_tasks: BackgroundTasks,
+    session: Session = Depends(get_session),
+    deadline: Deadline = Depends(get_deadline),
+):
+    with deadline.stage("fetch"):
+        query = session.query(Query).filter(Query.id == query_id).first()
+        if query is None:
+            raise HTTPException(status_code=404, detail="Query not found")
+        question = query.content
+        insights = session.query(Insight).filter(Insight.query_id == query_id).all()
+    # The marvin calls block on the LLM; they run in worker threads so that
+    # queued cheap requests are still served, and concurrently so that both
+    # share the remaining budget instead of splitting it.
+    answer, questions = await asyncio.gather(
+        deadline.run(
+            "answer", llm_executor, answer_with_insights, question, insights
+        ),
+        deadline.run(
+            "follow_up_questions",
+            llm_executor,
+            follow_up_questions,
+            question,
+            insights,
+            default=[],
+        ),
+    )
+    # Calls cut off by the deadline keep running. Background tasks run after
+    # the response is sent but before the admission middleware releases this
+    # request's slot, so abandoned LLM work still counts against the limit.
+    background_tasks.add_task(deadline.drain)
     return {
         "query": question,
         "insights": insights,
-        "answer": answer_with_insights(question, insights),
-        "follow_up_questions": follow_up_questions(question, insights),
+        "answer": answer,
+        "follow_up_questions": questions,
+        "partial": deadline.partial,
+        "timings": deadline.timings,
     }
 
 
@@ -188,3 +303,69 @@ async def append_insight(
             status_code=400,
             detail="A record with the same unique constraint already exists.",
         )
+
+
+@app.get("/entities/summary", response_model=List[EntitySummaryRead])
+def fetch_entity_summaries(
+    entity: List[str] = QueryParam(default=[]),
+    limit: int = QueryParam(default=100, ge=1, le=1000),
+    session: Session = Depends(get_session),
+):
+    return read_entity_summaries(session, entities=entity, limit=limit)
+
+
+@app.get("/entities/{entity}/summary", response_model=EntitySummaryRead)
+def fetch_entity_summary(entity: str, session: Session = Depends(get_session)):
+    summaries = read_entity_summaries(session, entities=[entity])
+    if not summaries:
+        raise HTTPException(status_code=404, detail="Entity not found")
+    return summaries[0]
+
+
+@app.get("/export/insights")
+def export_insights(
+    entity: Optional[str] = None,
+    category: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    after: Optional[str] = None,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    accept_encoding: Optional[str] = Header(default=None),
+):
+    """
+    Streams every matching insight in ULID order. Pass the id of the last
+    record received as `after` to resume an interrupted export. The body is
+    gzipped when the client's Accept-Encoding allows it.
+    """
+    table = Insight.__table__
+    filters = []
+    if entity is not None:
+        filters.append(table.c.entity == entity)
+    if category is not None:
+        filters.append(table.c.category == category)
+    if created_after is not None:
+        filters.append(table.c.created_at >= created_after)
+    if created_before is not None:
+        filters.append(table.c.created_at < created_before)
+    if after is not None:
+        filters.append(table.c.id > after)
+    return stream_export(engine, table, filters, format, accept_encoding)
+
+
+@app.get("/export/queries")
+def export_queries(
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    after: Optional[str] = None,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    accept_encoding: Optional[str] = Header(default=None),
+):
+    table = Query.__table__
+    filters = []
+    if created_after is not None:
+        filters.append(table.c.created_at >= created_after)
+    if created_before is not None:
+        filters.append(table.c.created_at < created_before)
+    if after is not None:
+        filters.append(table.c.id > after)
+    return stream_export(engine, table, filters, format, accept_encoding)
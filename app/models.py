@@ -1,6 +1,6 @@
 from sqlmodel import Field, Relationship, Session, SQLModel, create_engine
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional
 from datetime import datetime
 import ulid
 
@@ -33,6 +33,32 @@ class Insight(SQLModel, table=True):
     query: "Query" = Relationship(back_populates="insights")  # Add this line
 
 
+class EntitySummary(SQLModel, table=True):
+    # Rollup of all insights about one entity, kept in step with inserts and
+    # deletes so overview pages never have to scan the insight table.
+    entity: str = Field(primary_key=True)
+    insight_count: int = 0
+    confidence_sum: float = 0.0
+    latest_created_at: Optional[datetime] = None
+
+
+class EntityFacetCount(SQLModel, table=True):
+    # Per-entity insight counts broken down by `category` and `impact`.
+    entity: str = Field(primary_key=True)
+    facet: str = Field(primary_key=True)
+    value: str = Field(primary_key=True)
+    count: int = 0
+
+
+class EntitySummaryRead(BaseModel):
+    entity: str
+    insight_count: int
+    mean_confidence: Optional[float]
+    latest_created_at: Optional[datetime]
+    by_category: Dict[str, int]
+    by_impact: Dict[str, int]
+
+
 class QueryFetch(BaseModel):
     query: str
     insights: List[Insight]
@@ -41,8 +67,10 @@ class QueryFetch(BaseModel):
 class QueryFetchAnswer(BaseModel):
     query: str
     insights: List[Insight]
-    answer: str
-    follow_up_questions: List[str]
+    answer: Optional[str] = None
+    follow_up_questions: List[str] = []
+    partial: bool = False
+    timings: Dict[str, float] = {}
 
 
 class InsightCreate(BaseModel):
@@ -1,11 +1,12 @@
 import time
-from typing import List
+from typing import List, Optional
 from trafilatura import fetch_url, extract
 from models import CompanyInfo, InsightPoint, InsightType
 from enum import Enum
 import requests
 from bs4 import BeautifulSoup
 from settings import braveSync
+from deadline import Deadline
 
 
 class SearchService:
@@ -29,16 +30,35 @@ class ResearchService:
         """
         pass
 
-    def research_company(self, url: str) -> CompanyInfo:
-        downloaded = fetch_url(url)
-        text = extract(
-            downloaded, include_comments=False, include_tables=False, no_fallback=True
-        )
+    def research_company(
+        self, url: str, deadline: Optional[Deadline] = None
+    ) -> CompanyInfo:
+        # Each stage is skipped if the deadline has passed and cut off if it
+        # outlasts it, leaving its field empty and `deadline.partial` set, so
+        # one slow page cannot hold the request.
+        deadline = deadline or Deadline()
+        downloaded = deadline.call("fetch", fetch_url, url)
+        text = None
+        if downloaded:
+            text = deadline.call(
+                "extract",
+                extract,
+                downloaded,
+                include_comments=False,
+                include_tables=False,
+                no_fallback=True,
+            )
 
         return CompanyInfo(
             url=url,
-            summary=self.summarize_text(text),
-            key_points=self.extract_key_points(text),
+            summary=(
+                deadline.call("summarize", self.summarize_text, text) if text else None
+            ),
+            key_points=(
+                deadline.call("key_points", self.extract_key_points, text, default=[])
+                if text
+                else []
+            ),
         )
 
     def query_handler(self, query: str, id: str) -> List[InsightPoint]:
@@ -47,7 +67,9 @@ class ResearchService:
 
 
 class UrlRelevanceService:
-    def url_relevance(self, url: str, description: str = None) -> "UrlRelevance":
+    def url_relevance(
+        self, url: str, description: str = None, deadline: Optional[Deadline] = None
+    ) -> "UrlRelevance":
         """
         Determines the relevance of the provided `url` for oppositional research and insight generation about a company.
 
@@ -62,7 +84,17 @@ class UrlRelevanceService:
         import time
 
         x = time.perf_counter()
-        response = requests.get(url)
+        deadline = deadline or Deadline()
+        if deadline.expired:
+            deadline.skip("url_relevance")
+            return UrlRelevance(url, True, 0.5, [], None)
+        # requests has no notion of a budget, so cap the socket timeout instead.
+        try:
+            with deadline.stage("url_relevance"):
+                response = requests.get(url, timeout=deadline.remaining())
+        except requests.Timeout:
+            deadline.partial = True
+            return UrlRelevance(url, True, 0.5, [], None)
         soup = BeautifulSoup(response.content, "html.parser")
 
         # Extracting the description from the meta tag
@@ -20,3 +20,15 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not DATABASE_URL:
     print("Error: DATABASE_URL not set in environment variables.")
+
+# Admission control: concurrent slots, queue depth and queue timeout (seconds)
+# for requests that trigger LLM work, plain reads and long-running bulk exports.
+EXPENSIVE_CONCURRENCY = int(os.getenv("EXPENSIVE_CONCURRENCY", "2"))
+EXPENSIVE_QUEUE_SIZE = int(os.getenv("EXPENSIVE_QUEUE_SIZE", "8"))
+EXPENSIVE_QUEUE_TIMEOUT = float(os.getenv("EXPENSIVE_QUEUE_TIMEOUT", "30"))
+CHEAP_CONCURRENCY = int(os.getenv("CHEAP_CONCURRENCY", "32"))
+CHEAP_QUEUE_SIZE = int(os.getenv("CHEAP_QUEUE_SIZE", "64"))
+CHEAP_QUEUE_TIMEOUT = float(os.getenv("CHEAP_QUEUE_TIMEOUT", "5"))
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "2"))
+EXPORT_QUEUE_SIZE = int(os.getenv("EXPORT_QUEUE_SIZE", "4"))
+EXPORT_QUEUE_TIMEOUT = float(os.getenv("EXPORT_QUEUE_TIMEOUT", "30"))
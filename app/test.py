@@ -1,7 +1,8 @@
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel, HttpUrl
 from settings import tavily, braveSync, marvin
 from models import InsightCreate
+from deadline import Deadline
 import trafilatura
 import time
 
@@ -37,9 +38,15 @@ def get_link_text(url: str) -> str:
 
 
 def search_and_extract_content(
-    query: str, num_results: int = 1
+    query: str, num_results: int = 1, deadline: Optional[Deadline] = None
 ) -> List[SearchResultSite]:
-    search_results = braveSync.search(q=query, count=num_results)
+    deadline = deadline or Deadline()
+    # A search that outlasts the deadline is abandoned and yields no sites.
+    search_results = deadline.call(
+        "search", braveSync.search, q=query, count=num_results
+    )
+    if search_results is None:
+        return []
     sites = []
     for result in search_results.web_results:
         if result:
@@ -69,9 +76,18 @@ query = "What has Amazon done to differentiate itself from its competitors?"
 # # print(sites)
 
 
-def generate_n_insights(question: str, n: int) -> List[InsightCreate]:
-    sites = search_and_extract_content(query=question, num_results=n)
-    insights = [generate_insights(question, site) for site in sites]
+def generate_n_insights(
+    question: str, n: int, deadline: Optional[Deadline] = None
+) -> List[InsightCreate]:
+    # Insights that do not finish within the deadline are dropped and
+    # `deadline.partial` is set; the ones that did finish are still returned.
+    deadline = deadline or Deadline()
+    sites = search_and_extract_content(
+        query=question, num_results=n, deadline=deadline
+    )
+    insights = deadline.map(
+        "generate_insights", lambda site: generate_insights(question, site), sites
+    )
     return insights
 
 
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.deadline import MAX_WORKERS, Deadline
+
+
+def test_unbounded_deadline_never_expires():
+    deadline = Deadline()
+    assert deadline.remaining() is None
+    assert not deadline.expired
+    assert deadline.call("stage", lambda: "done") == "done"
+    assert not deadline.partial
+
+
+def test_call_skips_when_budget_spent():
+    deadline = Deadline(0)
+    calls = []
+    result = deadline.call("fetch", calls.append, 1, default="skipped")
+    assert result == "skipped"
+    assert calls == []
+    assert deadline.partial
+    assert deadline.timings == {"fetch": 0.0}
+
+
+def test_call_cuts_off_slow_stage():
+    deadline = Deadline(0.1)
+    start = time.perf_counter()
+    result = deadline.call("fetch", time.sleep, 1, default="late")
+    assert result == "late"
+    assert time.perf_counter() - start < 0.5
+    assert deadline.partial
+    assert deadline.timings["fetch"] < 0.5
+
+
+def test_call_propagates_errors():
+    deadline = Deadline(1)
+
+    def fail():
+        raise ValueError("Failed to download the page")
+
+    with pytest.raises(ValueError):
+        deadline.call("fetch", fail)
+    assert not deadline.partial
+
+
+def test_map_returns_completed_items_in_order():
+    deadline = Deadline(0.3)
+
+    def work(delay):
+        time.sleep(delay)
+        return delay
+
+    assert deadline.map("insights", work, [0.02, 0.01, 2]) == [0.02, 0.01]
+    assert deadline.partial
+
+
+def test_map_marks_failures_partial():
+    deadline = Deadline(1)
+
+    def work(item):
+        if item == 2:
+            raise ValueError("No content extracted")
+        return item
+
+    assert deadline.map("insights", work, [1, 2, 3]) == [1, 3]
+    assert deadline.partial
+
+
+def test_map_bounds_threads():
+    deadline = Deadline(2)
+    lock = threading.Lock()
+    running = peak = 0
+
+    def work(item):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return item
+
+    assert deadline.map("insights", work, range(40)) == list(range(40))
+    assert peak <= MAX_WORKERS
+    assert not deadline.partial
+
+
+def test_map_skips_when_budget_spent():
+    deadline = Deadline(0)
+    assert deadline.map("insights", lambda item: item, [1, 2]) == []
+    assert deadline.partial
+
+
+def test_run_returns_result_within_budget():
+    executor = ThreadPoolExecutor(max_workers=1)
+    deadline = Deadline(1)
+    result = asyncio.run(deadline.run("answer", executor, lambda: "answer"))
+    assert result == "answer"
+    assert not deadline.partial
+    assert deadline.abandoned == []
+
+
+def test_run_abandons_slow_call_and_drain_waits_for_it():
+    executor = ThreadPoolExecutor(max_workers=1)
+    finished = threading.Event()
+
+    def slow():
+        time.sleep(0.3)
+        finished.set()
+
+    async def scenario():
+        deadline = Deadline(0.05)
+        start = time.perf_counter()
+        result = await deadline.run("answer", executor, slow, default="none")
+        returned_after = time.perf_counter() - start
+        assert not finished.is_set()
+        await deadline.drain()
+        return deadline, result, returned_after
+
+    deadline, result, returned_after = asyncio.run(scenario())
+    assert result == "none"
+    assert returned_after < 0.2
+    assert finished.is_set()
+    assert deadline.partial
+    assert len(deadline.abandoned) == 1
+
+
+def test_run_skips_when_budget_spent():
+    executor = ThreadPoolExecutor(max_workers=1)
+    deadline = Deadline(0)
+    calls = []
+    result = asyncio.run(
+        deadline.run("answer", executor, calls.append, 1, default=[])
+    )
+    assert result == []
+    assert calls == []
+    assert deadline.partial
+    assert deadline.timings == {"answer": 0.0}
@@ -1,14 +1,27 @@
+import asyncio
+import json
 import pytest
 from fastapi.testclient import TestClient
-from datetime import date
+import ulid
+from datetime import date, datetime
+from sqlmodel import Session
 
-from app.main import app  # Import your FastAPI app instance
+from app.admission import AdmissionClass, AdmissionControlMiddleware
+from app.main import app, engine  # Import your FastAPI app instance
+from app.models import Insight, Query
 
 base_url = "http://localhost:8000"
 
 client = TestClient(app)  # Create a TestClient instance
 
 
+@pytest.fixture(scope="module", autouse=True)
+def lifespan():
+    # Run startup (table creation) and serve every request from one event loop.
+    with client:
+        yield
+
+
 @pytest.fixture
 def dummy_insight():
     return {
@@ -85,3 +98,169 @@ def test_delete_query():
     response = client.delete(f"/query/delete/{query_id}")
     assert response.status_code == 200
     assert response.text == f"Query with ID {query_id} has been deleted."
+
+
+def test_entity_summary(dummy_insight):
+    before = client.get(f"/entities/{dummy_insight['entity']}/summary")
+    count = before.json()["insight_count"] if before.status_code == 200 else 0
+
+    query = "Who is Bezos"
+    response = client.post("/query/send", params={"query": query})
+    assert response.status_code == 200
+
+    response = client.get(f"/entities/{dummy_insight['entity']}/summary")
+    assert response.status_code == 200
+    summary = response.json()
+    assert summary["insight_count"] == count + 2
+    assert summary["by_category"]["Company Overview"] >= 1
+
+    response = client.get("/entities/summary", params={"entity": ["Amazon"]})
+    assert response.status_code == 200
+    assert response.json()[0]["entity"] == "Amazon"
+
+
+def test_entity_summary_tracks_edits_to_expired_insights():
+    old_entity, new_entity = f"Old {ulid.new()}", f"New {ulid.new()}"
+    with Session(engine) as session:
+        query = Query(
+            content="Who is Bezos",
+            created_at=datetime.now(),
+            updated_at=datetime.now(),
+        )
+        session.add(query)
+        session.commit()
+        insight = Insight(
+            title="Amazon is a leading provider of e-commerce solutions",
+            category="Company Overview",
+            content="Amazon has revolutionized the e-commerce industry.",
+            source="https://www.amazon.com/",
+            impact="High",
+            confidence=0.5,
+            entity=old_entity,
+            created_at=datetime.now(),
+            query_id=query.id,
+        )
+        session.add(insight)
+        session.commit()
+
+        # The commit expired the instance, so these sets carry no loaded value.
+        insight.entity = new_entity
+        insight.confidence = 0.9
+        insight.category = "Competitive Position"
+        session.commit()
+        insight_id = insight.id
+
+    response = client.get(f"/entities/{old_entity}/summary")
+    assert response.status_code == 404
+    response = client.get(f"/entities/{new_entity}/summary")
+    assert response.status_code == 200
+    summary = response.json()
+    assert summary["insight_count"] == 1
+    assert summary["mean_confidence"] == pytest.approx(0.9)
+    assert summary["by_category"] == {"Competitive Position": 1}
+
+    with Session(engine) as session:
+        session.delete(session.get(Insight, insight_id))
+        session.commit()
+    assert client.get(f"/entities/{new_entity}/summary").status_code == 404
+
+
+def test_entity_summaries_reject_non_positive_limit():
+    response = client.get("/entities/summary", params={"limit": -1})
+    assert response.status_code == 422
+
+
+def test_admission_metrics():
+    client.get("/health")
+    response = client.get("/metrics/admission")
+    assert response.status_code == 200
+    metrics = response.json()
+    assert set(metrics) == {"expensive", "export", "cheap"}
+    assert metrics["cheap"]["admitted"] >= 1
+
+
+def test_admission_sheds_burst():
+    async def slow_app(scope, receive, send):
+        await asyncio.sleep(0.2)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    expensive = AdmissionClass(
+        "expensive", concurrency=1, queue_size=1, queue_timeout=1, retry_after=10
+    )
+    cheap = AdmissionClass(
+        "cheap", concurrency=4, queue_size=4, queue_timeout=1, retry_after=1
+    )
+    middleware = AdmissionControlMiddleware(
+        slow_app,
+        classes=[expensive, cheap],
+        routes=[("/query/fetch-answer", "expensive")],
+        default="cheap",
+    )
+
+    async def request(path):
+        # Drive the middleware directly so that every request of the burst
+        # arrives in the same event-loop tick.
+        response = {}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = dict(message["headers"])
+
+        await middleware({"type": "http", "path": path}, None, send)
+        return response
+
+    async def burst():
+        return await asyncio.gather(
+            *[request("/query/fetch-answer/1") for _ in range(4)],
+            request("/health"),
+        )
+
+    # Run the burst twice, each on a fresh event loop, as separate test
+    # clients or server restarts would.
+    for _ in range(2):
+        *heavy, health = asyncio.run(burst())
+        statuses = sorted(response["status"] for response in heavy)
+        assert statuses == [200, 200, 429, 429]
+        for response in heavy:
+            if response["status"] == 429:
+                assert int(response["headers"][b"retry-after"]) >= 10
+        assert health["status"] == 200
+    assert expensive.metrics()["rejected"] == 4
+
+
+def test_fetch_answer_deadline():
+    query = "Who is Bezos"
+    response = client.post("/query/send", params={"query": query})
+    assert response.status_code == 200
+    query_id = response.json()
+
+    response = client.get(
+        f"/query/fetch-answer/{query_id}", headers={"X-Request-Deadline": "1"}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["partial"] is True
+    assert len(body["insights"]) == 2
+    assert "fetch" in body["timings"]
+
+
+def test_export_insights(dummy_insight):
+    query = "Who is Bezos"
+    response = client.post("/query/send", params={"query": query})
+    assert response.status_code == 200
+    query_id = response.json()
+
+    response = client.get("/export/insights", params={"entity": "Amazon"})
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert all(record["entity"] == "Amazon" for record in records)
+    assert sum(record["query_id"] == query_id for record in records) == 2
+
+    ids = [record["id"] for record in records]
+    assert ids == sorted(ids)
+    response = client.get(
+        "/export/insights", params={"entity": "Amazon", "after": ids[-2]}
+    )
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == ids[-1:]
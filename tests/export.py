@@ -0,0 +1,155 @@
+import csv
+import io
+import threading
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from app.export import (
+    CHUNK_SIZE,
+    ExportError,
+    accepts_gzip,
+    encode_csv,
+    open_export,
+    prepare_resume,
+)
+
+
+def test_prepare_resume_truncates_partial_last_line(tmp_path):
+    path = tmp_path / "insights.ndjson"
+    path.write_bytes(b'{"id": "01A"}\n{"id": "01B"}\n{"id": "01C", "ti')
+    assert prepare_resume(str(path)) == "01B"
+    assert path.read_bytes() == b'{"id": "01A"}\n{"id": "01B"}\n'
+
+
+def test_prepare_resume_reads_past_long_partial_line(tmp_path):
+    path = tmp_path / "insights.ndjson"
+    partial = b'{"id": "01B", "content": "' + b"x" * 3 * CHUNK_SIZE
+    path.write_bytes(b'{"id": "01A"}\n' + partial)
+    assert prepare_resume(str(path)) == "01A"
+    assert path.read_bytes() == b'{"id": "01A"}\n'
+
+
+def test_prepare_resume_without_newline_empties_file(tmp_path):
+    path = tmp_path / "insights.ndjson"
+    path.write_bytes(b'{"id": "01A", "ti')
+    assert prepare_resume(str(path)) is None
+    assert path.read_bytes() == b""
+
+
+def test_prepare_resume_missing_file(tmp_path):
+    assert prepare_resume(str(tmp_path / "missing.ndjson")) is None
+
+
+def test_prepare_resume_rejects_foreign_last_line(tmp_path):
+    path = tmp_path / "insights.ndjson"
+    path.write_bytes(b'{"id": "01A"}\nnot a record\n')
+    with pytest.raises(ValueError):
+        prepare_resume(str(path))
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("gzip", True),
+        ("gzip, deflate, br", True),
+        ("GZIP;q=0.5", True),
+        ("x-gzip", True),
+        ("*", True),
+        ("gzip;q=0", False),
+        ("*;q=0", False),
+        ("br, gzip;q=0, *", False),
+        ("deflate", False),
+        ("", False),
+        (None, False),
+    ],
+)
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(header) is expected
+
+
+def test_encode_csv_quotes_fields():
+    rows = [
+        {
+            "id": "01A",
+            "title": 'Amazon, the "everything store"',
+            "content": "Line one\nLine two",
+            "created_at": datetime(2024, 3, 17, 9, 39, 11),
+        }
+    ]
+    columns = ["id", "title", "content", "created_at"]
+    text = "".join(encode_csv(iter(rows), columns))
+    parsed = list(csv.reader(io.StringIO(text)))
+    assert parsed == [
+        columns,
+        [
+            "01A",
+            'Amazon, the "everything store"',
+            "Line one\nLine two",
+            "2024-03-17T09:39:11",
+        ],
+    ]
+
+
+@pytest.fixture
+def export_server():
+    # Answers 429 with Retry-After until `busy` runs out, then 200.
+    state = {"busy": 0, "status": 429, "requests": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state["requests"] += 1
+            if state["busy"] > 0:
+                state["busy"] -= 1
+                self.send_response(state["status"])
+                self.send_header("Retry-After", "7")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = b'{"id": "01A"}\n'
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/export/insights"
+    yield state, url
+    server.shutdown()
+
+
+def test_open_export_retries_after_busy(export_server):
+    state, url = export_server
+    state["busy"] = 2
+    waits = []
+    with open_export(urllib.request.Request(url), 3, sleep=waits.append) as response:
+        assert response.read() == b'{"id": "01A"}\n'
+    assert waits == [7, 7]
+    assert state["requests"] == 3
+
+
+def test_open_export_gives_up_after_retries(export_server):
+    state, url = export_server
+    state["busy"] = 5
+    state["status"] = 503
+    waits = []
+    with pytest.raises(ExportError):
+        open_export(urllib.request.Request(url), 2, sleep=waits.append)
+    assert waits == [7, 7]
+    assert state["requests"] == 3
+
+
+def test_open_export_does_not_retry_other_errors(export_server):
+    state, url = export_server
+    state["busy"] = 1
+    state["status"] = 500
+    with pytest.raises(ExportError):
+        open_export(urllib.request.Request(url), 3, sleep=lambda seconds: None)
+    assert state["requests"] == 1